@@ -1,8 +1,129 @@
+import functools
+
+from aiohttp import ClientError
 from argopy import DataFetcher as ArgoDataFetcher
+from argopy.errors import APIServerError, DataNotFound
 import numpy as np
 
+## Variables kept from the fetched points: the core measurements, plus the
+## variables argopy needs to group points into profiles
+_ARGO_VARS = ['PLATFORM_NUMBER', 'CYCLE_NUMBER', 'DIRECTION', 'PRES', 'TEMP', 'PSAL']
+
+## Errors raised when a data source cannot be reached or fails to serve a
+## request, as opposed to DataNotFound when the region simply has no data.
+## Local failures (e.g. an unwritable cache directory) are not included, as
+## switching data source would not help.
+_SERVER_ERRORS = (APIServerError, ClientError, ConnectionError, TimeoutError)
+
+
+@functools.lru_cache(maxsize=4)
+def _fetch_profiles(bbox, dtg_start, dtg_end, min_db, max_db, src):
+    '''
+    Fetch the Argo profiles for a region and time period from data source src.
+
+    The region is split into chunks that argopy fetches in parallel. A chunk
+    that fails raises instead of being dropped, so an incomplete region is
+    never returned or cached. Requests are cached on disk by argopy, and the
+    few most recent regions are also kept in memory for repeated calls within
+    the same process (see clear_cache). Parameters are the same as
+    get_profile, except that bbox must be a tuple so that it can be hashed.
+
+    Returns
+    --------
+    xarray.Dataset
+        Argo profiles, indexed along N_PROF.
+    '''
+    argo_params = [*bbox, min_db, max_db, dtg_start, dtg_end]
+
+    ## Get the argo data for our specified space & time. The pressure bounds
+    ## are part of the region query, so they are applied server-side, and only
+    ## the core (non-BGC) dataset is requested.
+    argo_loader = ArgoDataFetcher(src=src, ds='phy', cache=True, parallel=True)
+    argo_loader = argo_loader.region(argo_params)
+    argo_pts = argo_loader.to_xarray(errors='raise')[_ARGO_VARS]
+
+    return argo_pts.argo.point2profile()
+
+
+def clear_cache():
+    '''
+    Release the Argo regions kept in memory by get_profile and get_profiles.
+
+    argopy's on-disk cache is left untouched, so later requests for the same
+    regions are still served without a network round-trip.
+    '''
+    _fetch_profiles.cache_clear()
+
+
+def _load_profiles(bbox, dtg_start, dtg_end, min_db, max_db, src, fallback_src):
+    '''
+    Fetch the Argo profiles from src, falling back to fallback_src if src
+    fails with a server or network error. Parameters are the same as
+    get_profile.
+
+    Returns
+    --------
+    xarray.Dataset
+        The memoized Argo profiles, which must not be modified in place.
+    '''
+    fetch_params = (tuple(bbox), dtg_start, dtg_end, min_db, max_db)
+    try:
+        return _fetch_profiles(*fetch_params, src)
+    except DataNotFound:
+        ## No data in the region is not a server failure, so don't fall back
+        raise
+    except _SERVER_ERRORS:
+        if fallback_src is None:
+            raise
+        return _fetch_profiles(*fetch_params, fallback_src)
+
+
+def get_profiles(bbox, dtg_start, dtg_end, min_db=0.0, max_db=2000.0, src='erddap',
+                 fallback_src='argovis'):
+    '''
+    Get all vertical profiles of temperature, salinity, and pressure from the
+    Argo floats in a region and time period, e.g. to pass to flatten_profiles.
+
+    Parameters
+    -----------
+    bbox : list of float
+        List of floats defining a geographical bounding box to select Argo float
+        samples from. Format: [min_lon, max_lon, min_lat, max_lat].
+    dtg_start : str
+        8-digit datetime group definining the start of the Argo sample period.
+        Format: YYYY-MM-DD.
+    dtg_end : str
+        8-digit datetime group defining the end of the Argo sample period.
+        Format: YYYY-MM-DD.
+    min_db : float, optional
+        Minimum pressure to include in Argo samples. Default is 0.
+    max_db : float, optional
+        Maximum pressure to include in Argo samples. Default is 2000.
+    src : str, optional
+        argopy data source to fetch the samples from. Default is 'erddap'.
+    fallback_src : str or None, optional
+        argopy data source to fetch the samples from if src fails with a
+        server or network error.
+        Set to None to disable the fallback. Default is 'argovis'.
+
+    Returns
+    --------
+    xarray.Dataset
+        Argo profiles, indexed along N_PROF.
 
-def get_profile(bbox, dtg_start, dtg_end, min_db=0.0, max_db=2000.0):
+    Raises
+    -------
+    argopy.errors.DataNotFound
+        If the data source has no samples for the region and time period.
+    '''
+    argo_profiles = _load_profiles(bbox, dtg_start, dtg_end, min_db, max_db, src, fallback_src)
+
+    ## Copy so that callers can't modify the memoized dataset
+    return argo_profiles.copy(deep=True)
+
+
+def get_profile(bbox, dtg_start, dtg_end, min_db=0.0, max_db=2000.0, src='erddap',
+                fallback_src='argovis'):
     '''
     Get a vertical profile of temperature, salinity, and pressure from an
     Argo float.
@@ -21,26 +142,69 @@ def get_profile(bbox, dtg_start, dtg_end, min_db=0.0, max_db=2000.0):
     min_db : float, optional
         Minimum pressure to include in Argo samples. Default is 0.
     max_db : float, optional
-        Maximum float to include in Argo samples. Default is 1500.
+        Maximum pressure to include in Argo samples. Default is 2000.
+    src : str, optional
+        argopy data source to fetch the samples from. Default is 'erddap'.
+    fallback_src : str or None, optional
+        argopy data source to fetch the samples from if src fails with a
+        server or network error.
+        Set to None to disable the fallback. Default is 'argovis'.
 
     Returns
     --------
-    xarray.DataArray
+    xarray.Dataset
+
+    Raises
+    -------
+    argopy.errors.DataNotFound
+        If the data source has no samples for the region and time period.
+    ValueError
+        If none of the profiles has at least max_db / 2 valid samples.
+    '''
+    argo_profiles = _load_profiles(bbox, dtg_start, dtg_end, min_db, max_db, src, fallback_src)
+
+    ## Select the first profile with ample data points
+    num_samples = np.count_nonzero(np.isfinite(argo_profiles.PRES.data), axis=1)
+    candidates = np.flatnonzero(num_samples >= max_db / 2)
+    if candidates.size == 0:
+        raise ValueError('No Argo profile with at least {} samples found'.format(max_db / 2))
+
+    ## Copy so that callers can't modify the memoized dataset through a view
+    return argo_profiles.isel(N_PROF=candidates[0]).copy(deep=True)
+
+
+def flatten_profiles(argo_profiles):
     '''
-    argo_params = bbox.append(min_db, max_db, dtg_start, dtg_end)
+    Flatten Argo profiles into contiguous arrays of their valid samples.
 
-    ## Get the argo data for our specified space & time
-    argo_loader = ArgoDataFetcher().region(argo_params)
-    argo_pts = argo_loader.to_xarray()
-    argo_profiles = argo_pts.argo.point2profile()
+    Samples are kept in profile order, with an offsets index marking where
+    each profile starts, so that all profiles can be processed in a single
+    call to the vectorized equations. Note that Argo pressure is in decibars:
+    convert it to depth first, e.g. with
+    equations.pressure_to_depth_leroy98(pres * 0.01, lat), which expects MPa.
+
+    Parameters
+    -----------
+    argo_profiles : xarray.Dataset
+        Argo profiles, as returned by get_profiles, with PRES, TEMP and PSAL variables of dimensions
+        (N_PROF, N_LEVELS), and a LATITUDE variable of dimension N_PROF.
+
+    Returns
+    --------
+    tuple of numpy.ndarray
+        (pres, temp, sal, lat, offsets): pressure in decibars, temperature in
+        degrees C, salinity in PSU and the latitude of each sample, in
+        degrees. The samples of profile i are pres[offsets[i]:offsets[i + 1]],
+        and likewise for temp, sal and lat.
+    '''
+    pres = argo_profiles.PRES.data
+    temp = argo_profiles.TEMP.data
+    sal = argo_profiles.PSAL.data
 
-    ## Select a profile
-    for argo_profiler in list(argo_profiles.N_PROF.data):
-        curr_profile = argo_profiles.isel(N_PROF=argo_profiler)
-        ## Make sure we have a vertical profile with ample data points
-        curr_press = curr_profile.PRES.data
-        num_samples = curr_pres[~np.isnan(curr_pres)]
-        if num_samples >= max_db / 2:
-            break
+    mask = np.isfinite(pres) & np.isfinite(temp) & np.isfinite(sal)
+    counts = np.count_nonzero(mask, axis=1)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    ## Match the measurement dtype so float32 profiles stay in single precision
+    lat = np.repeat(argo_profiles.LATITUDE.data, counts).astype(pres.dtype, copy=False)
 
-    return argo_profile
+    return pres[mask], temp[mask], sal[mask], lat, offsets
@@ -1,32 +1,261 @@
+import functools
+
 import numpy as np
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
 
-def sound_speed_seawater_leroy68(depth, lat):
+def _leroy69(depth, sal, temp):
     '''
-    Calculate the speed of sound (meters/second) in sea water using
-    Leroy's 1968 equation.
+    Leroy 1969 sound speed polynomial. See sound_speed_seawater_leroy69.
+    '''
+    t10 = temp - 10.
+    t18 = temp - 18.
+    s35 = sal - 35.
+
+    c = 1492.3 + t10 * (3 - 0.006 * t10) - 0.04 * t18 * t18 \
+        + s35 * (1.2 - 0.01 * t18) + depth / 61.
+
+    return c
+
+
+def _leroy69_out_of_range(depth, sal, temp):
+    '''
+    Flag samples outside the validity range of the Leroy 1969 equation.
+    '''
+    return (temp < -2) | (temp > 23) | (sal < 30) | (sal > 40) | (depth < 0) | (depth > 500)
+
+
+def _check_leroy69_range(depth, sal, temp):
+    '''
+    Raise a ValueError if any sample is outside the validity range of the
+    Leroy 1969 equation.
+    '''
+    bad = _leroy69_out_of_range(depth, sal, temp)
+    if np.any(bad):
+        raise ValueError('Inputs must be -2 < T < 23, 30 < S < 40 and 0 < D < 500; '
+                         'out of range at indices {}'.format(np.flatnonzero(bad)))
+
+
+def _leroy08(depth, sal, temp, lat):
+    '''
+    Leroy 2008 sound speed polynomial. See sound_speed_sea_water_leroy08.
+    '''
+    c = 1402.5 + temp * (5. + temp * (-5.44e-2 + 2.1e-4 * temp)) \
+        + sal * (1.33 + temp * (-1.23e-2 + 8.7e-5 * temp)) \
+        + depth * (1.56e-2 + 1.2e-6 * (lat - 45.) + 3e-7 * temp * temp + 1.43e-5 * sal
+                   + depth * (2.55e-7 - depth * (7.3e-12 + 9.5e-13 * temp)))
+
+    return c
+
+
+def _mackenzie81(depth, sal, temp):
+    '''
+    Mackenzie 1981 sound speed polynomial. See
+    sound_speed_sea_water_mackenzie81.
+    '''
+    c = 1448.96 + temp * (4.591 + temp * (-5.304e-2 + 2.374e-4 * temp)) \
+        + (sal - 35.) * (1.340 - 1.025e-2 * temp) \
+        + depth * (1.630e-2 + depth * (1.675e-7 - 7.139e-13 * temp * depth))
+
+    return c
+
+
+def _leroy98(press, lat, corrective_term):
+    '''
+    Leroy 1998 depth from pressure. See pressure_to_depth_leroy98.
+
+    Gravity is computed inline and the corrective term is always added, so
+    that the whole expression is evaluated in a single branchless pass.
+    '''
+    s = np.sin(np.deg2rad(lat))
+    s2 = s * s
+    g = 9.78031 * (1.0 + s2 * (5.2788e-3 - 2.36e-5 * s2))
+
+    d = press * (9.72659e2 + press * (-2.2512e-1 + press * (2.279e-4 - 1.82e-7 * press))) \
+        / (g + 1.092e-4 * press) + corrective_term
+
+    return d
+
+
+## Options shared by the compiled kernels. Releasing the GIL lets callers run
+## kernels from several threads, and the NumPy error model drops the
+## Python-style division checks so LLVM can vectorize the loops. Kernels are
+## compiled lazily, once per input type combination, on first use.
+_KERNEL_OPTIONS = dict(parallel=True, fastmath=True, cache=True, nogil=True,
+                       error_model='numpy')
+
+if njit is not None:
+    ## Elementwise versions of the polynomials, inlined into the parallel
+    ## kernels below so that each sample is computed in a single pass.
+    _leroy69_elem = njit(fastmath=True, error_model='numpy', inline='always')(_leroy69)
+    _leroy69_out_of_range_elem = njit(inline='always')(_leroy69_out_of_range)
+    _leroy08_elem = njit(fastmath=True, error_model='numpy', inline='always')(_leroy08)
+    _mackenzie81_elem = njit(fastmath=True, error_model='numpy', inline='always')(_mackenzie81)
+    _leroy98_elem = njit(fastmath=True, error_model='numpy', inline='always')(_leroy98)
+
+    @njit(**_KERNEL_OPTIONS)
+    def _leroy69_kernel(depth, sal, temp, out):
+        ## Count out-of-range samples in the same pass, so the caller only
+        ## builds the full mask when there is an error to report
+        num_flagged = 0
+        for i in prange(out.size):
+            out[i] = _leroy69_elem(depth[i], sal[i], temp[i])
+            if _leroy69_out_of_range_elem(depth[i], sal[i], temp[i]):
+                num_flagged += 1
+
+        return num_flagged
+
+    @njit(**_KERNEL_OPTIONS)
+    def _leroy08_kernel(depth, sal, temp, lat, out):
+        for i in prange(out.size):
+            out[i] = _leroy08_elem(depth[i], sal[i], temp[i], lat[i])
+
+    @njit(**_KERNEL_OPTIONS)
+    def _mackenzie81_kernel(depth, sal, temp, out):
+        for i in prange(out.size):
+            out[i] = _mackenzie81_elem(depth[i], sal[i], temp[i])
+
+    @njit(**_KERNEL_OPTIONS)
+    def _leroy98_kernel(press, lat, corrective_term, out):
+        for i in prange(out.size):
+            out[i] = _leroy98_elem(press[i], lat[i], corrective_term[i])
+else:
+    _leroy69_kernel = None
+    _leroy08_kernel = None
+    _mackenzie81_kernel = None
+    _leroy98_kernel = None
+
+if cp is not None:
+    ## GPU versions of the polynomials for CuPy inputs, e.g. 3D model grids
+    _leroy08_gpu = cp.ElementwiseKernel(
+        'T depth, T sal, T temp, T lat', 'T c',
+        '''
+        c = 1402.5 + temp * (5. + temp * (-5.44e-2 + 2.1e-4 * temp))
+            + sal * (1.33 + temp * (-1.23e-2 + 8.7e-5 * temp))
+            + depth * (1.56e-2 + 1.2e-6 * (lat - 45.) + 3e-7 * temp * temp + 1.43e-5 * sal
+                       + depth * (2.55e-7 - depth * (7.3e-12 + 9.5e-13 * temp)));
+        ''',
+        'leroy08')
+    _mackenzie81_gpu = cp.ElementwiseKernel(
+        'T depth, T sal, T temp', 'T c',
+        '''
+        c = 1448.96 + temp * (4.591 + temp * (-5.304e-2 + 2.374e-4 * temp))
+            + (sal - 35.) * (1.340 - 1.025e-2 * temp)
+            + depth * (1.630e-2 + depth * (1.675e-7 - 7.139e-13 * temp * depth));
+        ''',
+        'mackenzie81')
+else:
+    _leroy08_gpu = None
+    _mackenzie81_gpu = None
+
+
+def _array_module(*args):
+    '''
+    Return cupy if any of the inputs is a CuPy array, otherwise numpy.
+    '''
+    if cp is None:
+        return np
+
+    return cp.get_array_module(*args)
+
+
+## Scalar types passed to the polynomials as they are, without array conversion
+_SCALAR_TYPES = (int, float, np.generic)
+
+## Inputs smaller than this are evaluated with NumPy, as launching the parallel
+## kernel costs more than it saves on short arrays
+_KERNEL_MIN_SIZE = 2048
+
+
+def _as_float_arrays(*args, xp=np):
+    '''
+    Convert the inputs to broadcast floating point arrays of module ``xp``.
+
+    Single precision is kept when the array inputs are float32 (as Argo
+    PRES/TEMP/PSAL are); Python scalars do not promote the result. Anything
+    else is evaluated in double precision.
+    '''
+    arrays = [xp.asarray(arg) for arg in args]
+    typed = [arr.dtype for arg, arr in zip(args, arrays) if not isinstance(arg, (int, float))]
+    dtype = np.result_type(*typed, np.float32) if typed else np.float64
+
+    return xp.broadcast_arrays(*(arr.astype(dtype, copy=False) for arr in arrays))
+
+
+def _evaluate(kernel, func, *args, gpu_kernel=None, check=None):
+    '''
+    Evaluate an equation elementwise over the broadcast inputs.
+
+    Scalar inputs are passed to ``func`` as they are. CuPy inputs are
+    evaluated on the GPU with ``gpu_kernel`` if given. NumPy inputs with at
+    least _KERNEL_MIN_SIZE elements use the compiled Numba ``kernel`` when
+    available. Otherwise ``func`` is evaluated directly on the arrays.
+
+    ``check``, if given, raises on invalid inputs. It is called before
+    evaluation, except on the kernel path, where it is only called if the
+    kernel returns a nonzero count of flagged samples.
+    '''
+    if all(isinstance(arg, _SCALAR_TYPES) for arg in args):
+        if check is not None:
+            check(*args)
+        return func(*args)
+
+    xp = _array_module(*args)
+    args = _as_float_arrays(*args, xp=xp)
+    if xp is np and kernel is not None and args[0].size >= _KERNEL_MIN_SIZE:
+        out = np.empty(args[0].shape, dtype=args[0].dtype)
+        num_flagged = kernel(*(np.ravel(arg) for arg in args), out.reshape(-1))
+        if num_flagged and check is not None:
+            check(*args)
+        return out
+
+    if check is not None:
+        check(*args)
+    if xp is not np and gpu_kernel is not None:
+        return gpu_kernel(*args)
+
+    return func(*args)
+
+
+def depth_to_pressure_leroy68(depth, lat):
+    '''
+    Calculate the absolute pressure (Pascals) in sea water at a given depth
+    using Leroy's 1968 equation.
 
     Parameters
     -----------
-    depth : foat
-        Depth, in meters
-    lat : float
+    depth : float or array_like
+        Depth, in meters.
+    lat : float or array_like
         Latitude of sample, in degrees.
 
     Returns
     --------
-    float
+    float or numpy.ndarray
+        Absolute pressure, including atmospheric pressure, in Pascals.
 
     Reference
     ----------
     Lurton, X, 2002, An Introduction to Underwater Acoustics, 1st ed. London,
     Praxis Publishing LTD, p37.
     '''
-    # = 1.0052405 * (1 + 5.28 * 10^-3 * np.sin(lat)) * D + 2.36 * 10**-6 * D**2 + 10.196) * 10**4
-    c = (1 + 5.28 * 10^-3 * np.sin(lat)) * D + 2.36 * 10**-6 * D**2 + 10.196)
-    c *= 1.0052405 * 10**4
+    depth = np.asarray(depth)
 
-    return c
+    ## P = (1.0052405 * (1 + 5.28e-3 * sin^2(lat)) * D + 2.36e-6 * D^2 + 10.196) * 10^4
+    s = np.sin(np.deg2rad(lat))
+    p = 1.0052405 * (1 + 5.28e-3 * s * s) * depth + 2.36e-6 * depth * depth + 10.196
+    p *= 1e4
+
+    return p
 
 
 def sound_speed_seawater_leroy69(depth, sal, temp):
@@ -36,16 +265,16 @@ def sound_speed_seawater_leroy69(depth, sal, temp):
 
     Parameters
     -----------
-    depth : float
+    depth : float or array_like
         Depth, in meters.
-    sal : float
+    sal : float or array_like
         Salinity, in parts per thousand.
-    temp : float
+    temp : float or array_like
         Water temperature, in degrees C.
 
     Returns
     --------
-    float
+    float or numpy.ndarray
         Speed of sound, in meters / second.
 
     Reference
@@ -54,17 +283,8 @@ def sound_speed_seawater_leroy69(depth, sal, temp):
     realistic calculation of the speed of sound in sea water.
     J. acoust. Soc. Am., 46, 216-26.
     '''
-    if temp < -2 or temp > 23:
-        raise ValueError('Water temperature must be -2 < T < 23')
-    if sal < 30 or sal > 40:
-        raise ValueError('Salinity must be 30 < S < 40')
-    if depth < 0 or depth > 500:
-        raise ValueError('Depth must be 0 < D < 500')
-
-    c = 1492.3 + 3 * (temp - 10.) - 0.006 * (temp - 10.)**2 - 0.04 * (temp - 18.)**2
-    c += 1.2 * (sal - 35.) - 0.01 * (temp - 18.) * (sal - 35.) + depth / 61.
-
-    return c
+    return _evaluate(_leroy69_kernel, _leroy69, depth, sal, temp,
+                     check=_check_leroy69_range)
 
 
 def sound_speed_sea_water_leroy08(depth, sal, temp, lat):
@@ -74,19 +294,20 @@ def sound_speed_sea_water_leroy08(depth, sal, temp, lat):
 
     Parameters
     -----------
-    depth : float
+    depth : float or array_like
         Depth, in meters.
-    sal : float
+    sal : float or array_like
         Salinity, in parts per thousand.
-    temp : float
+    temp : float or array_like
         Water temperature, in degrees C.
-    lat : float
+    lat : float or array_like
         Latitude, in degrees.
 
     Returns
     --------
-    float
-        Speed of sound, in meters / second.
+    float, numpy.ndarray or cupy.ndarray
+        Speed of sound, in meters / second. CuPy inputs are evaluated on the
+        GPU and return a CuPy array.
 
     Reference
     ----------
@@ -94,13 +315,8 @@ def sound_speed_sea_water_leroy08(depth, sal, temp, lat):
     the accurate calculation of sound speed in all oceans,
     J. Acoust. Soc. Am., 124, 2774-82.
     '''
-    c = 1402.5 + 5. * temp - 5.44 * 10**-2 * temp**2 + 2.1 * 10**-4 * tmep**3 \
-        + 1.33 * sal - 1.23 * 10**-2 * sal * temp + 8.7 * 10**-5 * sal * temp**2 \
-        + 1.56 * 10**-2 * depth + 2.55 * 10**-7 * depth**2 - 7.3 * 10**-12 \
-        * depth**3 + 1.2 * 10**-6 * depth * (lat - 45.) - 9.5 * 10**-13 * temp \
-        * depth**3 + 3. * 10**-7 * temp**2 * depth + 1.43 * 10**-5 * sal * depth
-
-    return c
+    return _evaluate(_leroy08_kernel, _leroy08, depth, sal, temp, lat,
+                     gpu_kernel=_leroy08_gpu)
 
 
 def sound_speed_sea_water_mackenzie81(depth, sal, temp):
@@ -110,29 +326,52 @@ def sound_speed_sea_water_mackenzie81(depth, sal, temp):
 
     Parameters
     -----------
-    depth : float
+    depth : float or array_like
         Depth, in meters.
-    sal : float
+    sal : float or array_like
         Salinity, in parts per thousand.
-    temp : float
+    temp : float or array_like
         Water temperature, in degrees C.
 
     Returns
     --------
-    float
-        Speed of sound, in meters / second.
+    float, numpy.ndarray or cupy.ndarray
+        Speed of sound, in meters / second. CuPy inputs are evaluated on the
+        GPU and return a CuPy array.
 
     Reference
     ----------
     Mackenzie K.V., 1981, Nine-term equation for sound speed in the ocean.
     J. acoust. Soc. Am., 70, 807-12.
     '''
-    c = 1448.96 + 4.591 * temp - 5.304 * 10**-2 * temp**2 + 2.374 * 10**-4
-    c = c * temp**3 + 1.340 * (sal - 35.) + 1.630 * 10**-2 * depth + 1.675
-    c = c * 10**-7 * depth**2 - 1.025 * 10**-2 * temp * (sal - 35.) - 7.139
-    c = c * 10**-13 * temp * depth**3
+    return _evaluate(_mackenzie81_kernel, _mackenzie81, depth, sal, temp,
+                     gpu_kernel=_mackenzie81_gpu)
+
+
+def _sin2_lat(lat):
+    '''
+    Squared sine of latitude, used by the international gravity formula.
+    '''
+    s = np.sin(np.deg2rad(lat))
+
+    return s * s
 
-    return c
+
+def _gravity_factor(s2):
+    '''
+    Latitude-dependent factor of the international gravity formula, evaluated
+    in Horner form from the squared sine of latitude.
+    '''
+    return 1.0 + s2 * (5.2788e-3 - 2.36e-5 * s2)
+
+
+@functools.lru_cache(maxsize=4096)
+def _gravity_cached(lat):
+    '''
+    International gravity formula for a single latitude, memoized so that
+    repeated latitudes skip the sine evaluation.
+    '''
+    return 9.78031 * _gravity_factor(_sin2_lat(lat))
 
 
 def international_gravity_formula(lat, corrective_term=None):
@@ -141,22 +380,23 @@ def international_gravity_formula(lat, corrective_term=None):
 
     Parameters
     -----------
-    lat : float
+    lat : float or array_like
         Latitude, in degrees.
     corrective_term : float
         optional corrective term
 
     Returns
     --------
-    float
+    float or numpy.ndarray
         Average gravity for the given latitude.
     '''
-    g = 1 + 5.2788 * 10**-3* np.sin(lat * np.pi / 180.)**2
-    g = g - 2.36 * 10**-5 * np.sin(lat * np.pi / 180.)**4
-    g = g * 9.78031
+    if isinstance(lat, _SCALAR_TYPES):
+        g = _gravity_cached(lat)
+    else:
+        g = 9.78031 * _gravity_factor(_sin2_lat(lat))
 
-    if corrective_term != None:
-        g += corrective_term
+    if corrective_term is not None:
+        g = g + corrective_term
 
     return g
 
@@ -167,16 +407,16 @@ def pressure_to_depth_leroy98(press, lat, corrective_term=None):
 
     Parameters
     -----------
-    press : float
+    press : float or array_like
         Water pressure, in MPa (relative to atmospheric pressure).
-    lat : float
+    lat : float or array_like
         Latitude, in degrees.
-    corrective_term : float, optional
-        Corrective term.
+    corrective_term : float or array_like, optional
+        Corrective term, in meters.
 
     Returns
     --------
-    float
+    float or numpy.ndarray
         Depth, in meters.
 
     Reference
@@ -184,15 +424,10 @@ def pressure_to_depth_leroy98(press, lat, corrective_term=None):
     C. C. Leroy and F Parthiot, 1998, Depth-pressure relationship in the oceans
     and seas (1998), J. Acoust. Soc. Am. 103(3) pp 1346-1352
     '''
-    d = 9.780318 * (1 + 5.2788 * 10**-3 * np.sin(lat * np.pi / 180)**2 - 2.36 * \
-            10**-5 * np.sin(lat * np.pi / 180)**4) * (9.72659 * 10**2 * press - \
-            2.2512 * 10**-1 * P**2 + 2.279 * 10**-4 * press**3 - 1.82 * 10**-7 * \
-            press**4) / (international_gravity_formula(lat) + 1.092 * 10**-4 * press)
-
-    if corrective_term != None:
-        d += corrective_term
+    if corrective_term is None:
+        corrective_term = 0.
 
-    return d
+    return _evaluate(_leroy98_kernel, _leroy98, press, lat, corrective_term)
 
 
 def cutoff_frequency(c_water, depth):
@@ -201,14 +436,15 @@ def cutoff_frequency(c_water, depth):
 
     Parameters
     -----------
-    c_water : float
+    c_water : float or array_like
         Speed of sound in water, in meters/seconds.
-    depth : float
-        Depth of isothermal surface layer, in meters.
+    depth : float or array_like
+        Depth of isothermal surface layer, in meters. Broadcast against
+        c_water, e.g. to evaluate a grid of (c_water, depth) pairs.
 
     Returns
     --------
-    float
+    float or numpy.ndarray
         Cutoff frequency, in Hz.
 
     Reference
@@ -216,7 +452,9 @@ def cutoff_frequency(c_water, depth):
     Finn B. Jensen, William A. Kuperman, Michael B. Porter, Henrik Schmidt, 2011
     Computational Ocean Acoustics, 2nd Edition. Springer. pp. 26
     '''
-    f = c_water / (0.008 * depth**(3 / 2))
+    c_water, depth = np.asarray(c_water), np.asarray(depth)
+
+    f = c_water / (0.008 * depth * np.sqrt(depth))
 
     return f
 
@@ -227,16 +465,17 @@ def cutoff_frequency_shallow(c_water, c_bottom, depth):
 
     Parameters
     -----------
-    c_water : float
+    c_water : float or array_like
         Speed of sound in water, in meters/seconds.
-    c_bottom : float
+    c_bottom : float or array_like
         Speed of sound in a homogenous bottom, in meters/second.
-    depth : float
-        Depth of isothermal surface layer, in meters.
+    depth : float or array_like
+        Depth of isothermal surface layer, in meters. All three arguments are
+        broadcast against each other.
 
     Returns
     --------
-    float
+    float or numpy.ndarray
         Cutoff frequency, in Hz.
 
     Reference
@@ -244,6 +483,9 @@ def cutoff_frequency_shallow(c_water, c_bottom, depth):
     Finn B. Jensen, William A. Kuperman, Michael B. Porter, Henrik Schmidt, 2011
     Computational Ocean Acoustics, 2nd Edition. Springer. pp. 29
     '''
-    f = c_water / (depth * np.sqrt(1 - (c_water / c_bottom)**2))
+    c_water, c_bottom, depth = np.asarray(c_water), np.asarray(c_bottom), np.asarray(depth)
+
+    r = c_water / c_bottom
+    f = c_water * np.reciprocal(depth * np.sqrt(1. - r * r))
 
     return f
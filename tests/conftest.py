@@ -0,0 +1,5 @@
+import os
+import sys
+
+## The modules in src/ are not installed as a package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
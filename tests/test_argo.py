@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+
+xr = pytest.importorskip('xarray')
+pytest.importorskip('argopy')
+
+import argo
+import equations
+
+
+BBOX = [-70., -60., 30., 40.]
+
+
+@pytest.fixture
+def argo_profiles():
+    '''
+    Three profiles of six levels: 2, 4 and 6 valid pressure samples.
+    '''
+    pres = np.full((3, 6), np.nan, dtype=np.float32)
+    for i, num_samples in enumerate([2, 4, 6]):
+        pres[i, :num_samples] = np.arange(num_samples) * 10.
+
+    return xr.Dataset(
+        {'PRES': (('N_PROF', 'N_LEVELS'), pres),
+         'TEMP': (('N_PROF', 'N_LEVELS'), pres * 0 + 10.),
+         'PSAL': (('N_PROF', 'N_LEVELS'), pres * 0 + 35.)},
+        coords={'N_PROF': np.arange(3),
+                'LATITUDE': ('N_PROF', np.array([30., 35., 40.]))},
+    )
+
+
+@pytest.fixture
+def fetch(monkeypatch, argo_profiles):
+    '''
+    Replace the network fetch with the synthetic profiles.
+    '''
+    calls = []
+
+    def fake_fetch(*args):
+        calls.append(args)
+        return argo_profiles
+
+    monkeypatch.setattr(argo, '_fetch_profiles', fake_fetch)
+
+    return calls
+
+
+def test_get_profile_returns_first_qualifying_profile(fetch):
+    ## max_db / 2 = 3 samples: profile 0 has too few, profile 1 qualifies
+    profile = argo.get_profile(BBOX, '2020-01-01', '2020-02-01', max_db=6.)
+
+    assert int(profile.N_PROF) == 1
+    assert np.count_nonzero(np.isfinite(profile.PRES.data)) == 4
+
+
+def test_get_profile_no_qualifying_profile(fetch):
+    with pytest.raises(ValueError):
+        argo.get_profile(BBOX, '2020-01-01', '2020-02-01', max_db=20.)
+
+
+def test_get_profile_returns_a_copy(fetch, argo_profiles):
+    profile = argo.get_profile(BBOX, '2020-01-01', '2020-02-01', max_db=6.)
+    profile['PRES'].values[:] = -1.
+
+    assert argo_profiles.PRES.data[1, 0] == 0.
+
+
+@pytest.fixture
+def failing_fetch(monkeypatch, argo_profiles):
+    '''
+    Make the primary data source raise a given error; other sources succeed.
+    '''
+    calls = []
+
+    def install(error):
+        def fake_fetch(*args):
+            calls.append(args[-1])
+            if args[-1] == 'erddap':
+                raise error
+            return argo_profiles
+
+        monkeypatch.setattr(argo, '_fetch_profiles', fake_fetch)
+
+        return calls
+
+    return install
+
+
+@pytest.mark.parametrize('error', [
+    argo.APIServerError('server error'),
+    argo.ClientError('client error'),
+    ConnectionResetError('connection reset'),
+    TimeoutError('timed out'),
+])
+def test_get_profile_falls_back_on_server_errors(failing_fetch, error):
+    calls = failing_fetch(error)
+
+    profile = argo.get_profile(BBOX, '2020-01-01', '2020-02-01', max_db=6.)
+
+    assert calls == ['erddap', 'argovis']
+    assert int(profile.N_PROF) == 1
+
+
+@pytest.mark.parametrize('error', [
+    argo.DataNotFound('no data'),
+    PermissionError('cache directory is read-only'),
+])
+def test_get_profile_does_not_fall_back(failing_fetch, error):
+    calls = failing_fetch(error)
+
+    with pytest.raises(type(error)):
+        argo.get_profile(BBOX, '2020-01-01', '2020-02-01', max_db=6.)
+    assert calls == ['erddap']
+
+
+def test_get_profile_fallback_disabled(failing_fetch):
+    calls = failing_fetch(ConnectionResetError('connection reset'))
+
+    with pytest.raises(ConnectionResetError):
+        argo.get_profile(BBOX, '2020-01-01', '2020-02-01', max_db=6., fallback_src=None)
+    assert calls == ['erddap']
+
+
+def test_get_profiles_returns_all_profiles(fetch, argo_profiles):
+    profiles = argo.get_profiles(BBOX, '2020-01-01', '2020-02-01', max_db=6.)
+    profiles['PRES'].values[:] = -1.
+
+    assert profiles.sizes['N_PROF'] == 3
+    assert argo_profiles.PRES.data[1, 0] == 0.
+
+
+def test_get_profiles_falls_back_on_server_errors(failing_fetch):
+    calls = failing_fetch(ConnectionResetError('connection reset'))
+
+    profiles = argo.get_profiles(BBOX, '2020-01-01', '2020-02-01', max_db=6.)
+
+    assert calls == ['erddap', 'argovis']
+    assert profiles.sizes['N_PROF'] == 3
+
+
+def test_flatten_profiles(argo_profiles):
+    ## A sample with valid pressure but missing temperature is dropped too
+    argo_profiles['TEMP'].values[2, 3] = np.nan
+
+    pres, temp, sal, lat, offsets = argo.flatten_profiles(argo_profiles)
+
+    np.testing.assert_array_equal(offsets, [0, 2, 6, 11])
+    np.testing.assert_array_equal(pres, [0., 10., 0., 10., 20., 30., 0., 10., 20., 40., 50.])
+    np.testing.assert_array_equal(temp, np.full(11, 10.))
+    np.testing.assert_array_equal(sal, np.full(11, 35.))
+    np.testing.assert_array_equal(lat, [30.] * 2 + [35.] * 4 + [40.] * 5)
+    assert lat.dtype == pres.dtype == np.float32
+
+
+def test_flatten_profiles_to_depth(argo_profiles):
+    pres, _, _, lat, _ = argo.flatten_profiles(argo_profiles)
+    depth = equations.pressure_to_depth_leroy98(pres * 0.01, lat)
+
+    ## 1 dbar is roughly 1 m near the surface
+    np.testing.assert_allclose(depth, pres, rtol=0.02)
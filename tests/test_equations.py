@@ -0,0 +1,190 @@
+import numpy as np
+import pytest
+
+import equations
+
+
+def leroy69_reference(depth, sal, temp):
+    '''
+    Leroy 1969, term by term as published.
+    '''
+    return 1492.3 + 3 * (temp - 10.) - 6e-3 * (temp - 10.)**2 - 4e-2 * (temp - 18.)**2 \
+        + 1.2 * (sal - 35.) - 1e-2 * (temp - 18.) * (sal - 35.) + depth / 61.
+
+
+def leroy08_reference(depth, sal, temp, lat):
+    '''
+    Leroy et al. 2008, term by term as published.
+    '''
+    return 1402.5 + 5 * temp - 5.44e-2 * temp**2 + 2.1e-4 * temp**3 + 1.33 * sal \
+        - 1.23e-2 * sal * temp + 8.7e-5 * sal * temp**2 + 1.56e-2 * depth \
+        + 2.55e-7 * depth**2 - 7.3e-12 * depth**3 + 1.2e-6 * depth * (lat - 45.) \
+        - 9.5e-13 * temp * depth**3 + 3e-7 * temp**2 * depth + 1.43e-5 * sal * depth
+
+
+def mackenzie81_reference(depth, sal, temp):
+    '''
+    Mackenzie 1981, term by term as published.
+    '''
+    return 1448.96 + 4.591 * temp - 5.304e-2 * temp**2 + 2.374e-4 * temp**3 \
+        + 1.340 * (sal - 35.) + 1.630e-2 * depth + 1.675e-7 * depth**2 \
+        - 1.025e-2 * temp * (sal - 35.) - 7.139e-13 * temp * depth**3
+
+
+KERNELS = ['_leroy69_kernel', '_leroy08_kernel', '_mackenzie81_kernel', '_leroy98_kernel']
+
+
+@pytest.fixture(params=['numpy', 'numba'])
+def backend(request, monkeypatch):
+    '''
+    Evaluate array inputs with NumPy only, or always with the Numba kernels.
+    '''
+    if request.param == 'numpy':
+        for name in KERNELS:
+            monkeypatch.setattr(equations, name, None)
+    elif equations.njit is None:
+        pytest.skip('Numba is not installed')
+    else:
+        monkeypatch.setattr(equations, '_KERNEL_MIN_SIZE', 0)
+
+    return request.param
+
+
+@pytest.fixture
+def profile():
+    depth = np.linspace(0., 500., 101)
+    sal = np.linspace(30., 40., 101)
+    temp = np.linspace(-2., 23., 101)
+
+    return depth, sal, temp
+
+
+def test_mackenzie81_check_value():
+    ## Check value given by Mackenzie (1981)
+    c = equations.sound_speed_sea_water_mackenzie81(1000., 35., 25.)
+
+    assert c == pytest.approx(1550.744, abs=1e-3)
+
+
+@pytest.mark.parametrize('func, reference', [
+    (equations.sound_speed_seawater_leroy69, leroy69_reference),
+    (equations.sound_speed_sea_water_mackenzie81, mackenzie81_reference),
+])
+def test_scalar_matches_reference(func, reference):
+    assert func(250., 35., 10.) == pytest.approx(reference(250., 35., 10.), abs=1e-9)
+
+
+def test_leroy08_scalar_matches_reference():
+    c = equations.sound_speed_sea_water_leroy08(250., 35., 10., 30.)
+
+    assert c == pytest.approx(leroy08_reference(250., 35., 10., 30.), abs=1e-9)
+
+
+@pytest.mark.parametrize('func, reference', [
+    (equations.sound_speed_seawater_leroy69, leroy69_reference),
+    (equations.sound_speed_sea_water_mackenzie81, mackenzie81_reference),
+])
+def test_array_matches_reference(backend, profile, func, reference):
+    c = func(*profile)
+
+    assert c.dtype == np.float64
+    np.testing.assert_allclose(c, reference(*profile), rtol=0, atol=1e-9)
+
+
+def test_leroy08_array_matches_reference(backend, profile):
+    c = equations.sound_speed_sea_water_leroy08(*profile, 30.)
+
+    np.testing.assert_allclose(c, leroy08_reference(*profile, 30.), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('func, extra', [
+    (equations.sound_speed_seawater_leroy69, ()),
+    (equations.sound_speed_sea_water_leroy08, (30.,)),
+    (equations.sound_speed_sea_water_mackenzie81, ()),
+])
+def test_float32_input(backend, profile, func, extra):
+    c64 = func(*profile, *extra)
+    c32 = func(*(arr.astype(np.float32) for arr in profile), *extra)
+
+    assert c32.dtype == np.float32
+    np.testing.assert_allclose(c32, c64, rtol=0, atol=1e-2)
+
+
+def test_readonly_and_broadcast_input(backend, profile):
+    depth = profile[0].copy()
+    depth.flags.writeable = False
+
+    c = equations.sound_speed_sea_water_mackenzie81(depth, 35., 10.)
+
+    np.testing.assert_allclose(c, mackenzie81_reference(depth, 35., 10.), rtol=0, atol=1e-9)
+
+
+def test_leroy69_out_of_range(backend, profile):
+    depth = profile[0].copy()
+    depth[[3, 50]] = 600.
+
+    with pytest.raises(ValueError, match=r'indices \[ 3 50\]'):
+        equations.sound_speed_seawater_leroy69(depth, *profile[1:])
+    with pytest.raises(ValueError):
+        equations.sound_speed_seawater_leroy69(600., 35., 10.)
+
+
+def test_leroy69_nan_input_is_not_out_of_range(backend, profile):
+    depth = profile[0].copy()
+    depth[3] = np.nan
+
+    c = equations.sound_speed_seawater_leroy69(depth, *profile[1:])
+
+    assert np.isnan(c[3])
+    assert np.count_nonzero(np.isnan(c)) == 1
+
+
+def test_pressure_to_depth_array_matches_scalar(backend):
+    press = np.linspace(0., 60., 13)
+    depth = equations.pressure_to_depth_leroy98(press, 45., corrective_term=1.)
+    expected = [equations.pressure_to_depth_leroy98(p, 45., corrective_term=1.) for p in press]
+
+    np.testing.assert_allclose(depth, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('func, gpu_kernel, extra', [
+    (equations._leroy08, '_leroy08_gpu', (30.,)),
+    (equations._mackenzie81, '_mackenzie81_gpu', ()),
+])
+@pytest.mark.parametrize('dtype, atol', [(np.float64, 1e-9), (np.float32, 1e-2)])
+def test_gpu_kernel_matches_cpu(profile, func, gpu_kernel, extra, dtype, atol):
+    cp = pytest.importorskip('cupy')
+    profile = [arr.astype(dtype) for arr in profile]
+    extra = [np.full_like(profile[0], value) for value in extra]
+
+    c_gpu = getattr(equations, gpu_kernel)(*(cp.asarray(arr) for arr in profile + extra))
+
+    assert c_gpu.dtype == dtype
+    np.testing.assert_allclose(cp.asnumpy(c_gpu), func(*profile, *extra), rtol=0, atol=atol)
+
+
+def test_depth_to_pressure_leroy68():
+    ## Atmospheric pressure at the surface, and the sin^2(lat) dependence
+    assert equations.depth_to_pressure_leroy68(0., 45.) == pytest.approx(1.0196e5)
+    assert equations.depth_to_pressure_leroy68(100., 0.) == pytest.approx(1107436.5)
+    assert equations.depth_to_pressure_leroy68(100., 90.) == pytest.approx(1.0052405e6 * 1.00528 + 1.0196e5 + 236.)
+    np.testing.assert_allclose(equations.depth_to_pressure_leroy68([100., 100.], [90., -90.]),
+                               equations.depth_to_pressure_leroy68(100., 90.))
+
+
+def test_pressure_to_depth_check_value(backend):
+    ## 10 MPa at 45 degrees is about 989.5 m (Leroy and Parthiot, 1998)
+    assert equations.pressure_to_depth_leroy98(10., 45.) == pytest.approx(989.5, abs=0.1)
+
+    depth = equations.pressure_to_depth_leroy98(np.full(4, 10.), 45., corrective_term=1.)
+    np.testing.assert_allclose(depth, 990.5, atol=0.1)
+
+
+def test_international_gravity_formula():
+    lat = np.array([0., 45., 90.])
+    expected = [equations.international_gravity_formula(float(value)) for value in lat]
+
+    assert equations.international_gravity_formula(0.) == pytest.approx(9.78031)
+    np.testing.assert_allclose(equations.international_gravity_formula(lat), expected)
+    assert equations.international_gravity_formula(45., corrective_term=0.1) \
+        == pytest.approx(expected[1] + 0.1)